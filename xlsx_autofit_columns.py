@@ -10,21 +10,29 @@ Excel自动调整行高列宽工具
 
 import os
 import sys
+import unicodedata
 import argparse
-import openpyxl
-from openpyxl import load_workbook
+import functools
+import math
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from array import array
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Alignment, Font
 from openpyxl.utils import get_column_letter
-from openpyxl import styles
-import re
 
 
 # 字符宽度常量
 CHAR_WIDTH = {
-    'ascii': 0.7,  # ASCII字符（英文、数字、符号）
+    'ascii': 0.7,  # ASCII字符（英文、数字、符号）及其他窄字符（如带重音的拉丁字母、半角片假名）
     'cjk': 2.0,    # 中日韩字符
     'emoji': 2.0,  # Emoji表情符号
 }
 
+# 在中文字体中按全角显示的符号的码位范围：通用标点（不含前面的各种空格和格式控制字符）、
+# 字母式符号、数字形式、箭头、数学运算符、带圈数字、制表符、几何图形、杂项符号、装饰符号等
+WIDE_SYMBOL_RANGE = range(0x2010, 0x2C00)
+
 # 默认配置
 DEFAULT_CONFIG = {
     'width_factor': 1.3,      # 列宽调整系数 (增加以显示更充分)
@@ -40,6 +48,7 @@ DEFAULT_CONFIG = {
     'enable_cell_alignment': True,  # 是否启用单元格对齐方式
     'horizontal_alignment': 'center',  # 水平对齐方式：'left', 'center', 'right'
     'vertical_alignment': 'center',    # 垂直对齐方式：'top', 'center', 'bottom'
+    'enable_fast_rewrite': False,  # 是否启用快速模式（只读取单元格值并写入新工作簿，不保留原有样式）
 }
 
 # 默认要处理的Excel文件列表
@@ -59,10 +68,33 @@ def get_char_type(char):
     code = ord(char)
     if code <= 127:  # ASCII字符
         return 'ascii'
-    elif code > 0x1F000:  # Emoji范围
+    elif 0x1F000 <= code < 0x20000:  # Emoji范围
         return 'emoji'
-    else:  # 假设其他都是中日韩字符
+    
+    east_asian_width = unicodedata.east_asian_width(char)
+    if east_asian_width in ('W', 'F'):  # 中日韩文字（含扩展B及以后）、全角符号、宽Emoji（如✅⭐）
+        return 'cjk'
+    elif code in WIDE_SYMBOL_RANGE:  # 中文标点（如“”…—）及各种符号（如※★①→℃）
         return 'cjk'
+    elif east_asian_width == 'A' and not unicodedata.category(char).startswith('L'):
+        # 宽度不定的非字母符号在中文字体中按全角显示（如·°×÷§）
+        return 'cjk'
+    elif code > 0x1F000:  # 其他辅助平面字符仍按Emoji宽度处理
+        return 'emoji'
+    else:  # 其他字符（如带重音的拉丁字母、希腊字母、西里尔字母、半角片假名）按窄字符处理
+        return 'ascii'
+
+
+class _CharWidthTable(dict):
+    """字符宽度表：查询表中没有的字符时，按字符类型计算宽度并记录下来"""
+    
+    def __missing__(self, char):
+        width = self[char] = CHAR_WIDTH[get_char_type(char)]
+        return width
+
+
+# 已出现过的字符的宽度（文本中出现的不同字符数量有限）
+_CHAR_WIDTHS = _CharWidthTable()
 
 
 def calculate_text_width(text, font_size=11):
@@ -70,17 +102,24 @@ def calculate_text_width(text, font_size=11):
     if not text:
         return 0
     
-    # 将文本转换为字符串
-    text = str(text)
-    
-    # 计算每个字符的宽度并求和
-    width = 0
-    for char in text:
-        char_type = get_char_type(char)
-        width += CHAR_WIDTH.get(char_type, CHAR_WIDTH['ascii'])
-    
+    # 将文本转换为字符串后再查询缓存，保证缓存键可哈希
+    return _text_width(str(text), font_size)
+
+
+@functools.lru_cache(maxsize=4096)
+def _text_width(text, font_size):
+    """计算字符串文本宽度（带缓存，表格中常有大量重复文本）"""
     # 根据字体大小调整宽度
     font_factor = font_size / DEFAULT_CONFIG['default_font_size']
+    
+    # 纯ASCII文本（编号、数字、英文）最常见，无需逐字符判断类型
+    if text.isascii():
+        return len(text) * CHAR_WIDTH['ascii'] * font_factor
+    
+    # 混合文本：由map和sum在C层面遍历字符并查字符宽度表，循环中没有分支和Python函数调用，
+    # 只有首次出现的字符才需要判断类型
+    width = sum(map(_CHAR_WIDTHS.__getitem__, text))
+    
     return width * font_factor
 
 
@@ -98,11 +137,18 @@ def calculate_text_height(text, column_width, font_size=11):
     if not text:
         return 1
     
-    # 将文本转换为字符串
-    text = str(text)
+    # 将文本转换为字符串后再查询缓存，保证缓存键可哈希
+    return _text_height(str(text), column_width, font_size)
+
+
+@functools.lru_cache(maxsize=4096)
+def _text_height(text, column_width, font_size):
+    """计算字符串文本高度（带缓存）"""
+    font_factor = font_size / DEFAULT_CONFIG['default_font_size']
+    ascii_width = CHAR_WIDTH['ascii'] * font_factor
     
-    # 处理文本中的硬换行
-    lines = text.split('\n')
+    # 处理文本中的硬换行（大多数单元格只有一行，这时不需要分割字符串）
+    lines = text.split('\n') if '\n' in text else (text,)
     
     # 计算每行需要的高度（同时考虑硬换行和自动换行）
     total_lines = 0
@@ -111,25 +157,34 @@ def calculate_text_height(text, column_width, font_size=11):
             total_lines += 1
             continue
             
-        # 计算这行文本的宽度
-        line_width = calculate_text_width(line, font_size)
+        # 计算这行文本的宽度，纯ASCII行直接按字符数计算；其他文本按单位字号宽度换算，
+        # 与autofit_sheet中计算列宽时使用相同的缓存项，不必重新计算
+        if line.isascii():
+            line_width = len(line) * ascii_width
+        else:
+            line_width = _text_width(line, 1) * font_size
         
         # 计算这行文本需要的行数（考虑一定的边距）
         if column_width > 0:
             # 减去一些边距，使文本有更好的显示效果
             effective_width = column_width * 0.9
-            line_count = (line_width / effective_width)
             # 向上取整
-            line_count = int(line_count) + (1 if line_count > int(line_count) else 0)
+            line_count = math.ceil(line_width / effective_width)
             total_lines += max(1, line_count)
         else:
             total_lines += 1
     
     # 根据字体大小调整高度
-    font_factor = font_size / DEFAULT_CONFIG['default_font_size']
     return total_lines * font_factor + 1
 
 
+def clear_text_metric_cache():
+    """清空文本宽度和高度的计算缓存"""
+    _CHAR_WIDTHS.clear()
+    _text_width.cache_clear()
+    _text_height.cache_clear()
+
+
 def calculate_space_utilization(text_size, container_size):
     """计算空间利用率"""
     if container_size <= 0:
@@ -146,122 +201,181 @@ def adjust_font_size(original_size, utilization, min_factor=0.8, max_factor=1.5)
     return original_size * adjustment_factor
 
 
-def autofit_columns(worksheet, config=None):
-    """自动调整列宽"""
-    if config is None:
-        config = DEFAULT_CONFIG
+@functools.lru_cache(maxsize=256)
+def get_font(size, name):
+    """获取指定字号和字体名的字体对象（相同参数复用同一个对象）"""
+    return Font(size=size, name=name)
+
+
+def get_alignment_id(cell):
+    """获取单元格对齐方式在工作簿样式表中的编号，单元格还没有样式或无法获取时返回None
     
-    # 获取工作表的数据范围
-    data_rows = list(worksheet.rows)
-    if not data_rows:
-        return
+    读取cell.alignment再比较对齐对象本身比直接赋值还要慢，因此这里读取openpyxl
+    内部的样式编号（依赖openpyxl 3.1的StyleArray.alignmentId）。如果以后的openpyxl
+    版本中没有这个属性，返回None，调用方会按不同处理，直接重新赋值。
+    """
+    return getattr(getattr(cell, '_style', None), 'alignmentId', None)
+
+
+def autofit_sheet(worksheet, config=None):
+    """自动调整列宽和行高
     
-    # 遍历所有列
-    for col_idx in range(1, worksheet.max_column + 1):
-        col_letter = get_column_letter(col_idx)
-        max_width = 0
-        cells_in_column = []
-        
-        # 遍历该列的所有单元格
-        for row_idx in range(1, worksheet.max_row + 1):
-            cell = worksheet.cell(row=row_idx, column=col_idx)
-            if cell.value is not None:
-                # 获取单元格字体大小，如果没有则使用默认值
-                font_size = getattr(getattr(cell, 'font', None), 'size', None) or config['default_font_size']
-                
-                # 计算单元格内容宽度
-                text_width = calculate_text_width(cell.value, font_size)
-                max_width = max(max_width, text_width)
-                
-                cells_in_column.append((cell, text_width, font_size))
-                
-                # 根据配置设置单元格对齐方式和自动换行
-                if config['enable_cell_alignment']:
-                    cell.alignment = openpyxl.styles.Alignment(
-                        horizontal=config['horizontal_alignment'],
-                        vertical=config['vertical_alignment'],
-                        wrap_text=config['enable_cell_wrap']
-                    )
-        
-        # 应用列宽调整系数
-        adjusted_width = max_width * config['width_factor']
-        
-        # 根据配置决定是否限制列宽
-        if config['enable_size_limits']:
-            final_width = max(config['min_width'], min(config['max_width'], adjusted_width))
-        else:
-            final_width = adjusted_width
-        
-        # 设置列宽
-        worksheet.column_dimensions[col_letter].width = final_width
-        
-        # 根据配置决定是否优化字体大小
-        if config['enable_font_autofit']:
-            for cell, text_width, original_font_size in cells_in_column:
-                utilization = calculate_space_utilization(text_width, final_width)
-                new_font_size = adjust_font_size(original_font_size, utilization)
-                
-                if abs(new_font_size - original_font_size) > 0.1:  # 只在字体大小变化明显时才修改
-                    cell.font = openpyxl.styles.Font(
-                        size=new_font_size,
-                        name=getattr(getattr(cell, 'font', None), 'name', None) or 'Arial'
-                    )
-
-def autofit_rows(worksheet, config=None):
-    """自动调整行高"""
+    只遍历一次工作表的单元格：遍历时记录每列的最大文本宽度和非空单元格，
+    确定列宽后再基于这些记录计算行高，避免对单元格的重复访问。
+    """
     if config is None:
         config = DEFAULT_CONFIG
     
-    # 遍历所有行
-    for row_idx in range(1, worksheet.max_row + 1):
-        max_height = 0
-        cells_in_row = []
-        
-        # 遍历该行的所有单元格
-        for col_idx in range(1, worksheet.max_column + 1):
-            cell = worksheet.cell(row=row_idx, column=col_idx)
+    # 工作表没有任何单元格时不调整列宽（只取第一行判断，不把整个工作表读入列表）
+    has_data = next(iter(worksheet.rows), None) is not None
+    
+    # 获取工作表的数据范围，并缓存列字母，避免在循环中重复计算
+    max_row = worksheet.max_row
+    max_col = worksheet.max_column
+    col_letters = [get_column_letter(col_idx) for col_idx in range(1, max_col + 1)]
+    default_font_size = config['default_font_size']
+    font_autofit = config['enable_font_autofit']
+    
+    # 遍历一次所有单元格，记录非空单元格及每列的最大文本宽度
+    # 非空单元格的信息按相同顺序存放在几个并列的紧凑数组中，避免为每个单元格创建元组
+    cell_refs = []            # 非空单元格
+    cell_rows = array('I')    # 行索引（从0开始）
+    cell_cols = array('I')    # 列索引（从0开始）
+    font_sizes = array('d')   # 字体大小
+    font_names = []           # 字体名称（仅在字体大小自适应时记录）
+    unit_widths = array('d')  # 单位字号下的文本宽度（仅在字体大小自适应时记录）
+    col_max_widths = [0] * max_col
+    for row_idx, row in enumerate(worksheet.iter_rows(min_row=1, max_row=max_row, max_col=max_col)):
+        for col_idx, cell in enumerate(row):
             if cell.value is not None:
                 # 获取单元格字体大小，如果没有则使用默认值
-                font_size = getattr(getattr(cell, 'font', None), 'size', None) or config['default_font_size']
+                # cell.font每次访问都会重新查找样式，因此每个单元格只读取一次
+                font = cell.font
+                font_size = font.size or default_font_size
                 
-                # 获取列宽
-                col_letter = get_column_letter(col_idx)
-                col_width = worksheet.column_dimensions[col_letter].width
+                # 计算单元格内容宽度：文本宽度与字体大小成正比，只计算一次单位字号下的宽度，
+                # 其他字号下的宽度直接按比例换算
+                unit_width = calculate_text_width(cell.value, 1)
+                text_width = unit_width * font_size
+                col_max_widths[col_idx] = max(col_max_widths[col_idx], text_width)
                 
-                # 计算单元格内容高度
-                text_height = calculate_text_height(cell.value, col_width, font_size)
-                max_height = max(max_height, text_height)
-                cells_in_row.append((cell, text_height, font_size, col_width))
-        
-        # 应用行高调整系数
-        adjusted_height = max_height * config['height_factor'] * 15  # 转换为Excel行高单位
-        
-        # 根据配置决定是否限制行高
-        if config['enable_size_limits']:
-            final_height = max(config['min_height'], min(config['max_height'], adjusted_height))
-        else:
-            final_height = adjusted_height
-        
-        # 设置行高
-        worksheet.row_dimensions[row_idx].height = final_height
-        
-        # 根据配置决定是否优化字体大小
-        if config['enable_font_autofit']:
-            for cell, text_height, original_font_size, col_width in cells_in_row:
-                # 计算空间利用率
-                utilization = calculate_space_utilization(text_height * 15, final_height)
-                new_font_size = adjust_font_size(original_font_size, utilization)
+                cell_refs.append(cell)
+                cell_rows.append(row_idx)
+                cell_cols.append(col_idx)
+                font_sizes.append(font_size)
+                if font_autofit:
+                    unit_widths.append(unit_width)
+                    font_names.append(font.name or 'Arial')
+    
+    # 根据每列最大文本宽度确定列宽：应用列宽调整系数，并根据配置决定是否限制列宽
+    width_factor = config['width_factor']
+    adjusted_widths = [max_width * width_factor for max_width in col_max_widths]
+    if config['enable_size_limits']:
+        min_width, max_width = config['min_width'], config['max_width']
+        final_widths = [max(min_width, min(max_width, width)) for width in adjusted_widths]
+    else:
+        final_widths = adjusted_widths
+    
+    # 统一设置列宽
+    if has_data:
+        # 只在确实需要设置列宽时才获取列尺寸对象（会自动创建不存在的列尺寸）
+        col_dims = [worksheet.column_dimensions[col_letter] for col_letter in col_letters]
+        for col_dim, final_width in zip(col_dims, final_widths):
+            col_dim.width = final_width
+    
+    # 根据配置决定是否按列宽优化字体大小
+    if font_autofit:
+        for i, cell in enumerate(cell_refs):
+            original_font_size = font_sizes[i]
+            utilization = calculate_space_utilization(unit_widths[i] * original_font_size, final_widths[cell_cols[i]])
+            new_font_size = adjust_font_size(original_font_size, utilization)
+            
+            if abs(new_font_size - original_font_size) > 0.1:  # 只在字体大小变化明显时才修改
+                cell.font = get_font(new_font_size, font_names[i])
+                font_sizes[i] = new_font_size
+    
+    # 使用确定后的列宽计算每个单元格的内容高度
+    row_max_heights = [0] * max_row
+    text_heights = array('d')  # 文本高度（仅在字体大小自适应时记录）
+    for cell, row_idx, col_idx, font_size in zip(cell_refs, cell_rows, cell_cols, font_sizes):
+        text_height = calculate_text_height(cell.value, final_widths[col_idx], font_size)
+        row_max_heights[row_idx] = max(row_max_heights[row_idx], text_height)
+        if font_autofit:
+            text_heights.append(text_height)
+    
+    # 根据每行最大文本高度确定行高：应用行高调整系数（转换为Excel行高单位），并根据配置决定是否限制行高
+    height_factor = config['height_factor']
+    adjusted_heights = [max_height * height_factor * 15 for max_height in row_max_heights]
+    if config['enable_size_limits']:
+        min_height, max_height = config['min_height'], config['max_height']
+        final_heights = [max(min_height, min(max_height, height)) for height in adjusted_heights]
+    else:
+        final_heights = adjusted_heights
+    
+    # 统一设置行高
+    row_dims = worksheet.row_dimensions
+    for row_idx, final_height in enumerate(final_heights, 1):
+        row_dims[row_idx].height = final_height
+    
+    # 根据配置决定是否按行高优化字体大小
+    if font_autofit:
+        cell_info = zip(cell_refs, cell_rows, cell_cols, font_sizes, font_names, unit_widths, text_heights)
+        for cell, row_idx, col_idx, original_font_size, font_name, unit_width, text_height in cell_info:
+            # 计算空间利用率
+            utilization = calculate_space_utilization(text_height * 15, final_heights[row_idx])
+            new_font_size = adjust_font_size(original_font_size, utilization)
+            
+            if abs(new_font_size - original_font_size) > 0.1:  # 只在字体大小变化明显时才修改
+                # 检查新字体大小是否会导致文本过宽（按单位字号宽度换算，无需重新计算文本宽度）
+                text_width = unit_width * new_font_size
+                width_utilization = calculate_space_utilization(text_width, final_widths[col_idx])
                 
-                if abs(new_font_size - original_font_size) > 0.1:  # 只在字体大小变化明显时才修改
-                    # 检查新字体大小是否会导致文本过宽
-                    text_width = calculate_text_width(cell.value, new_font_size)
-                    width_utilization = calculate_space_utilization(text_width, col_width)
-                    
-                    if width_utilization <= 0.9:  # 确保不会因为增大字体而导致文本过宽
-                        cell.font = openpyxl.styles.Font(
-                            size=new_font_size,
-                            name=getattr(getattr(cell, 'font', None), 'name', None) or 'Arial'
-                        )
+                if width_utilization <= 0.9:  # 确保不会因为增大字体而导致文本过宽
+                    cell.font = get_font(new_font_size, font_name)
+    
+    # 最后统一设置单元格对齐方式和自动换行，所有单元格共用同一个对齐对象
+    if config['enable_cell_alignment']:
+        alignment = Alignment(
+            horizontal=config['horizontal_alignment'],
+            vertical=config['vertical_alignment'],
+            wrap_text=config['enable_cell_wrap']
+        )
+        # 已经是目标对齐方式的单元格不再重复赋值
+        alignment_id = None
+        for cell in cell_refs:
+            if alignment_id is None or get_alignment_id(cell) != alignment_id:
+                cell.alignment = alignment
+                alignment_id = get_alignment_id(cell)
+
+
+def load_values_workbook(file_path):
+    """以只读模式读取单元格值，并写入一个新建的工作簿
+    
+    只读模式跳过了样式解析，大文件加载速度快很多。新工作簿只保留单元格的值和数字格式，
+    原有的字体、边框、填充、合并单元格等格式不会保留，公式会替换为文件中保存的计算结果，
+    图表工作表（chartsheet）和工作表的隐藏状态也不会保留。
+    注意：没有保存计算结果的公式（如openpyxl、pandas等程序生成的文件中的公式）会变成空单元格。
+    """
+    source = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        workbook = Workbook()
+        workbook.remove(workbook.active)
+        for source_sheet in source.worksheets:
+            worksheet = workbook.create_sheet(source_sheet.title)
+            # 只读模式按文件中记录的数据范围读取，而很多程序写出的数据范围并不准确，
+            # 先重置数据范围，确保读取到所有单元格
+            source_sheet.reset_dimensions()
+            for row_idx, row in enumerate(source_sheet.iter_rows(), 1):
+                worksheet.append([source_cell.value for source_cell in row])
+                # 复制数字格式（日期、百分比、货币等），只读模式下可以直接读取
+                for col_idx, source_cell in enumerate(row, 1):
+                    number_format = source_cell.number_format
+                    if number_format and number_format != 'General':
+                        worksheet.cell(row=row_idx, column=col_idx).number_format = number_format
+    finally:
+        # 只读模式会保持文件打开，需要手动关闭
+        source.close()
+    return workbook
 
 
 def process_excel_file(file_path, output_path=None, config=None):
@@ -285,6 +399,9 @@ def process_excel_file(file_path, output_path=None, config=None):
     if config is None:
         config = DEFAULT_CONFIG
     
+    # 每个文件开始前清空文本尺寸缓存，不同文件之间的文本很少重复
+    clear_text_metric_cache()
+    
     try:
         # 尝试检查文件是否可访问
         try:
@@ -303,16 +420,19 @@ def process_excel_file(file_path, output_path=None, config=None):
         
         # 加载工作簿
         print(f"正在处理文件: {file_path}")
-        workbook = load_workbook(file_path, read_only=False)
+        if config.get('enable_fast_rewrite'):
+            workbook = load_values_workbook(file_path)
+        else:
+            workbook = load_workbook(file_path, read_only=False)
         
         # 处理每个工作表
         for sheet_name in workbook.sheetnames:
-            print(f"  调整工作表: {sheet_name}")
+            # 并行处理多个文件时输出会交错，因此每行都带上文件名
+            print(f"  [{os.path.basename(file_path)}] 调整工作表: {sheet_name}")
             worksheet = workbook[sheet_name]
             
-            # 先调整列宽，再调整行高
-            autofit_columns(worksheet, config)
-            autofit_rows(worksheet, config)
+            # 一次遍历中同时调整列宽和行高
+            autofit_sheet(worksheet, config)
         
         # 尝试保存工作簿
         try:
@@ -345,6 +465,21 @@ def process_default_files(config=None):
         print("警告：未在代码中设置默认文件路径，请在DEFAULT_FILES列表中添加文件路径或使用命令行参数指定文件")
         return False
     
+    # 各文件相互独立，文件数较多时使用多进程并行处理（每个进程处理一个文件）
+    max_workers = min(len(DEFAULT_FILES), os.cpu_count() or 1)
+    if max_workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(process_excel_file, DEFAULT_FILES, repeat(None), repeat(config)))
+        except Exception as e:
+            # process_excel_file会自行处理文件错误，这里只会是进程池本身出错（如子进程因内存不足被终止）
+            print(f"并行处理文件时出错: {str(e)}")
+            print("\n如果问题持续存在，请尝试：")
+            print("1. 检查是否有文件过大导致内存不足")
+            print("2. 使用命令行参数逐个处理文件")
+            return False
+        return all(results)
+    
     success = True
     for file_path in DEFAULT_FILES:
         file_success = process_excel_file(file_path, None, config)
@@ -382,13 +517,16 @@ def main():
                         default=DEFAULT_CONFIG['horizontal_alignment'], help='水平对齐方式')
     parser.add_argument('--vertical-alignment', choices=['top', 'center', 'bottom'],
                         default=DEFAULT_CONFIG['vertical_alignment'], help='垂直对齐方式')
+    parser.add_argument('--fast-rewrite', action='store_true', dest='enable_fast_rewrite',
+                        help='快速模式：只读取单元格值并写入新工作簿，适合大文件（不保留原有样式）')
     
     # 设置功能开关的默认值
     parser.set_defaults(
         enable_size_limits=DEFAULT_CONFIG['enable_size_limits'],
         enable_font_autofit=DEFAULT_CONFIG['enable_font_autofit'],
         enable_cell_wrap=DEFAULT_CONFIG['enable_cell_wrap'],
-        enable_cell_alignment=DEFAULT_CONFIG['enable_cell_alignment']
+        enable_cell_alignment=DEFAULT_CONFIG['enable_cell_alignment'],
+        enable_fast_rewrite=DEFAULT_CONFIG['enable_fast_rewrite']
     )
     
     # 解析命令行参数
@@ -409,6 +547,7 @@ def main():
         'enable_cell_alignment': args.enable_cell_alignment,
         'horizontal_alignment': args.horizontal_alignment,
         'vertical_alignment': args.vertical_alignment,
+        'enable_fast_rewrite': args.enable_fast_rewrite,
     }
     
     # 处理Excel文件